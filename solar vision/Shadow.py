@@ -1,78 +1,197 @@
 ## `plot_heatmap.py` (针对 `heliostat_1000_shading_map.csv`)
+import argparse
+import functools
+import os
+import tempfile
 import numpy as np
 import pandas as pd
+import pyarrow.csv as pac
 import matplotlib.pyplot as plt
 import matplotlib as mpl
+from scipy import ndimage
+from PIL import Image
 
 
-def plot_heatmap(csv_file_path, heliostat_id):
+def save_heatmap_png(arr, cmap, vmin, vmax, path):
     """
-    从CSV文件加载数据并绘制高清热力图。
+    不经过 matplotlib 的画布，直接将矩阵按色谱映射后保存为 PNG（每个元素对应一个像素）。
+    """
+    cmap = mpl.colormaps.get_cmap(cmap)
+    # 第 0 行位于图像底部（与 origin='lower' 一致），PNG 则从顶部开始写，因此上下翻转；
+    # 在映射前翻转，色谱输出的 RGBA 就是 C 连续的，PIL 不必再为负步长的视图复制一次
+    rgba = cmap(mpl.colors.Normalize(vmin, vmax)(arr[::-1]), bytes=True)
+    Image.fromarray(rgba).save(path, optimize=False, compress_level=1)
+
+
+def load_shading_matrix(csv_file_path):
+    """
+    从CSV文件加载遮挡效率数据并转换为 2D 矩阵（行对应 Y_Index，列对应 X_Index，缺失点为 NaN）。
+
+    矩阵缓存在 `<csv_file_path>.npy` 中：缓存不比 CSV 旧时直接内存映射读取，跳过 CSV 解析。
+    同一进程内按 (路径, 修改时间) 记忆结果，多次绘图可共享同一个只读矩阵。
+    出错时打印原因并返回 None。
     """
-    # 1. 使用 Pandas 加载数据
     print(f"Loading data from {csv_file_path}...")
     try:
-        df = pd.read_csv(csv_file_path)
+        csv_mtime = os.path.getmtime(csv_file_path)
     except FileNotFoundError:
         print(f"Error: File not found at {csv_file_path}")
         print("Please make sure the CSV file is in the same directory as the script.")
-        return  # 如果文件不存在则退出
+        return None  # 如果文件不存在则退出
+    return _load_shading_matrix(csv_file_path, csv_mtime)
 
-    # 2. 将数据转换为 2D Numpy 数组（矩阵）
-    # 检查数据是否完整
-    if 'X_Index' not in df.columns or 'Y_Index' not in df.columns or 'Shading_Efficiency' not in df.columns:
-        print("Error: CSV file must contain 'X_Index', 'Y_Index', and 'Shading_Efficiency' columns.")
-        return
 
-    # 使用 pivot 方法将长格式数据转换为宽格式（矩阵）
+@functools.lru_cache(maxsize=8)
+def _load_shading_matrix(csv_file_path, csv_mtime):
+    cache_path = csv_file_path + '.npy'
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= csv_mtime:
+        try:
+            return np.load(cache_path, mmap_mode='r')
+        except (OSError, ValueError) as e:
+            # 缓存文件损坏时重新解析 CSV，并在下方覆盖它
+            print(f"Warning: ignoring damaged cache file {cache_path}: {e}")
+
+    # 检查数据是否完整：只读取表头所在的第一个数据块得到列名，列缺失时不必解析整个文件
     try:
-        heatmap_data = df.pivot(index='Y_Index', columns='X_Index', values='Shading_Efficiency').values
-    except Exception as e:
-        print(f"Error processing data into a matrix. Is the data for a full grid? Error: {e}")
-        return
+        with pac.open_csv(csv_file_path) as reader:
+            missing = {'X_Index', 'Y_Index', 'Shading_Efficiency'} - set(reader.schema.names)
+    except ValueError as e:
+        print(f"Error: could not parse {csv_file_path}: {e}")
+        return None
+    if missing:
+        print(f"Error: {csv_file_path} is missing columns: {', '.join(sorted(missing))}")
+        return None
 
+    # 1. 使用 Pandas 加载数据
+    try:
+        # 使用 pyarrow 引擎多线程解析，只读取需要的列并指定 dtype，避免类型推断
+        df = pd.read_csv(
+            csv_file_path,
+            engine='pyarrow',
+            usecols=['X_Index', 'Y_Index', 'Shading_Efficiency'],
+            dtype={'X_Index': 'int32', 'Y_Index': 'int32', 'Shading_Efficiency': 'float32'},
+        )
+    except ValueError as e:
+        print(f"Error: could not parse {csv_file_path}: {e}")
+        return None
+
+    # 2. 将数据转换为 2D Numpy 数组（矩阵）
+    # 取出三列为独立的 Numpy 数组，按 (Y, X) 索引一次性写入预分配的矩阵
+    # 不需要排序或 pivot 的哈希分组；缺失的网格点保留为 NaN
+    y = df['Y_Index'].to_numpy(np.int32)
+    x = df['X_Index'].to_numpy(np.int32)
+    v = df['Shading_Efficiency'].to_numpy(np.float32)
+    # 直接按索引写入时，负索引会绕回另一侧、重复的 (Y, X) 只保留最后一个值，因此先检查
+    if y.size == 0 or y.min() < 0 or x.min() < 0 or \
+            np.bincount(y.astype(np.int64) * (x.max() + 1) + x).max() > 1:
+        print("Error processing data into a matrix. Is the data for a full grid?")
+        return None
+    heatmap_data = np.full((y.max() + 1, x.max() + 1), np.nan, np.float32)
+    heatmap_data[y, x] = v
+
+    # 先写入同一目录下的临时文件再替换，写入中途被中断也不会留下不完整的缓存
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(cache_path) + '.', suffix='.tmp',
+                                        dir=os.path.dirname(os.path.abspath(cache_path)))
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, heatmap_data)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Warning: could not write cache file {cache_path}: {e}")
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    heatmap_data.flags.writeable = False  # 结果会被多次调用共享，禁止原地修改
+    return heatmap_data
+
+
+def plot_heatmap(heatmap_data, heliostat_id, raster_only=False, show=False):
+    """
+    根据遮挡效率矩阵（由 load_shading_matrix 加载）绘制高清热力图。
+
+    raster_only=True 时只保存热力图本身的栅格 PNG（无标题、坐标轴和颜色条），
+    跳过 matplotlib 的绘图流程，也不显示图像。
+    show=True 时保存后在屏幕上显示图像，否则保存后直接关闭画布（批处理模式）。
+    """
     # 获取矩阵维度
     side_length_y, side_length_x = heatmap_data.shape
 
+    if raster_only:
+        output_filename = f"heliostat_{heliostat_id}_map_raster.png"
+        save_heatmap_png(heatmap_data, 'viridis', 0, 1, output_filename)
+        print(f"Success! Saved raster map to {output_filename}")
+        return
+
     # =======================================================================
     # 优化后的高清绘图方式
     # =======================================================================
     # a) 设置画布和DPI
-    fig, ax = plt.subplots(figsize=(10, 8))
+    #    constrained_layout=True: 绘制时自动排版，保存时不需要 bbox_inches='tight' 的额外渲染
+    fig, ax = plt.subplots(figsize=(10, 8), constrained_layout=True)
 
-    # b) 使用 imshow 绘图, 关键参数:
-    #    interpolation='none': 禁止颜色插值，让每个像素块都棱角分明
-    #    origin='lower':      让 (0,0) 点位于左下角，符合常规坐标系
+    # b) 网格是均匀的，使用 pcolorfast 绘图（走最简单的图像路径，不需要 imshow 的重采样）, 关键点:
+    #    最近邻贴图:          不做颜色插值，让每个像素块都棱角分明
+    #    第 0 行画在底部:      让 (0,0) 点位于左下角，符合常规坐标系
     #    cmap='viridis':      一个视觉效果很好的色谱
-    im = ax.imshow(heatmap_data, interpolation='none', origin='lower', cmap='viridis', vmin=0, vmax=1)
+    #    x/y 范围:            固定为微面元索引坐标，降采样后坐标轴刻度不变
+    #    数组比 300 dpi 下的输出像素还大时，先降采样到输出尺寸，避免 AGG 逐像素缩放
+    target_w, target_h = int(fig.get_figwidth() * 300), int(fig.get_figheight() * 300)
+    if side_length_x > target_w or side_length_y > target_h:
+        zoom_factors = (min(1.0, target_h / side_length_y), min(1.0, target_w / side_length_x))
+        heatmap_data = ndimage.zoom(heatmap_data, zoom_factors, order=1)
+    # 以连续的 float32 数组交给色谱，并预先裁剪到 [vmin, vmax]，减少 Normalize 的内存带宽
+    # （从 pyarrow 读取的列可能是只读的，这里由 clip 生成新数组而不是原地修改）
+    heatmap_data = np.clip(heatmap_data, 0, 1, dtype=np.float32)
+    #    一次性映射为 uint8 RGBA 图像，绘制时不再逐次执行 Normalize + 色谱转换
+    norm = mpl.colors.Normalize(vmin=0, vmax=1)
+    cmap = mpl.colormaps['viridis']
+    rgba = cmap(norm(heatmap_data), bytes=True)
+    ax.pcolorfast([-0.5, side_length_x - 0.5], [-0.5, side_length_y - 0.5], rgba)
+    ax.set_aspect('equal')  # 与 imshow 一样保持像素为正方形
 
     # c) 设置标题和标签
     ax.set_title(f"Shading Efficiency Map for Heliostat {heliostat_id} (High Resolution)", fontsize=16)
     ax.set_xlabel("Microfacet X Index", fontsize=12)
     ax.set_ylabel("Microfacet Y Index", fontsize=12)
 
-    # d) 创建一个颜色条
-    cbar = fig.colorbar(im, ax=ax)
+    # d) 创建一个颜色条（与图像共用 norm 和 cmap）
+    sm = mpl.cm.ScalarMappable(norm, cmap)
+    sm.set_array([])  # 旧版 matplotlib 需要
+    cbar = fig.colorbar(sm, ax=ax)
     cbar.set_label('Shading Efficiency', rotation=270, labelpad=15, fontsize=12)
 
     # e) 调整刻度，避免过于密集
     #    如果微面元数量很多，可以每隔10个或20个显示一个刻度
     tick_interval = max(1, side_length_x // 12)  # 自动计算刻度间隔，最多显示12个标签
-    ax.set_xticks(np.arange(0, side_length_x, tick_interval))
-    ax.set_yticks(np.arange(0, side_length_y, tick_interval))
+    ax.set_xticks(list(range(0, side_length_x, tick_interval)))  # 刻度很少，用列表即可，无需 ndarray
+    ax.set_yticks(list(range(0, side_length_y, tick_interval)))
 
     # f) 保存为高分辨率图像文件
     #    dpi=300 是印刷级别的清晰度，非常适合查看细节
+    #    compress_level=1: PNG 编码比默认的 zlib 6 级快得多，文件只略大一些
     output_filename = f"heliostat_{heliostat_id}_map_sharp.png"
-    plt.savefig(output_filename, dpi=300, bbox_inches='tight')
+    plt.savefig(output_filename, dpi=300, pil_kwargs={'compress_level': 1})
 
     print(f"Success! Saved sharp, high-resolution map to {output_filename}")
-    plt.show()  # 在屏幕上显示图像
+    if show:
+        plt.show()  # 在屏幕上显示图像
+    else:
+        plt.close(fig)
 
 
 # --- 主程序入口 ---
 # --- 主程序入口 ---
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Plot the shading efficiency map of a heliostat.")
+    parser.add_argument('--show', action='store_true', help="display the map on screen after saving it")
+    parser.add_argument('--raster-only', action='store_true',
+                        help="only save the bare colour-mapped raster (one pixel per microfacet) via PIL")
+    args = parser.parse_args()
+    # 批处理模式（默认）使用无界面的 Agg 后端，跳过 GUI 后端及其事件循环的初始化
+    # pyplot 在创建第一个图形时才真正加载后端，因此这里设置仍然有效
+    if not args.show:
+        mpl.use('Agg')
+
     # --- 修改这里 ---
     HELIOSAT_ID = 1000  # 定义变量，全大写
     # ----------------
@@ -80,4 +199,6 @@ if __name__ == '__main__':
     CSV_PATH = f"heliostat_{HELIOSAT_ID}_shading_map.csv"
 
     # 确保调用函数时使用的变量名与定义时完全一致（包括大小写）
-    plot_heatmap(CSV_PATH, HELIOSAT_ID)
\ No newline at end of file
+    HEATMAP_DATA = load_shading_matrix(CSV_PATH)
+    if HEATMAP_DATA is not None:
+        plot_heatmap(HEATMAP_DATA, HELIOSAT_ID, raster_only=args.raster_only, show=args.show)
\ No newline at end of file
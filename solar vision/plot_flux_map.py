@@ -1,17 +1,104 @@
+import argparse
+import functools
+import os
+import tempfile
 import pandas as pd
 import numpy as np
+import pyarrow.csv as pac
+import matplotlib as mpl
 import matplotlib.pyplot as plt
 from matplotlib import font_manager
+from scipy import ndimage
 
 
-def plot_receiver_flux_map(csv_file, receiver_base_z, receiver_height):
+def load_flux_matrix(csv_file):
     """
-    读取CUDA仿真生成的接收器能流密度数据并绘制热力图。
+    读取接收器能流密度CSV文件并转换为二维网格（行对应 Z_Index，列对应 Theta_Index，缺失点为 NaN）。
+
+    网格缓存在 `<csv_file>.npy` 中：缓存不比 CSV 旧时直接内存映射读取，跳过 CSV 解析。
+    同一进程内按 (路径, 修改时间) 记忆结果，多次绘图可共享同一个只读网格。
+    找不到文件或缺少所需的列时打印提示并返回 None。
+    """
+    print(f"正在读取数据文件: {csv_file}...")
+    try:
+        csv_mtime = os.path.getmtime(csv_file)
+    except FileNotFoundError:
+        print(f"错误：找不到文件 '{csv_file}'。请确保CUDA程序已成功运行并生成该文件。")
+        return None
+    return _load_flux_matrix(csv_file, csv_mtime)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_flux_matrix(csv_file, csv_mtime):
+    cache_path = csv_file + '.npy'
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= csv_mtime:
+        try:
+            return np.load(cache_path, mmap_mode='r')
+        except (OSError, ValueError) as e:
+            # 缓存文件损坏时重新解析 CSV，并在下方覆盖它
+            print(f"警告：缓存文件 '{cache_path}' 已损坏，将重新读取CSV: {e}")
+
+    # 先只读取第一个数据块得到列名，列缺失时不必解析整个文件
+    try:
+        with pac.open_csv(csv_file) as reader:
+            missing = {'Z_Index', 'Theta_Index', 'Flux_Density(W/m^2)'} - set(reader.schema.names)
+    except ValueError as e:
+        print(f"错误：无法解析文件 '{csv_file}': {e}")
+        return None
+    if missing:
+        print(f"错误：文件 '{csv_file}' 缺少数据列: {', '.join(sorted(missing))}")
+        return None
+
+    try:
+        # 使用 pyarrow 引擎并只读取绘图所需的三列，整数/浮点列使用 32 位类型减少内存
+        df = pd.read_csv(
+            csv_file,
+            engine='pyarrow',
+            usecols=['Z_Index', 'Theta_Index', 'Flux_Density(W/m^2)'],
+            dtype={'Z_Index': 'int32', 'Theta_Index': 'int32', 'Flux_Density(W/m^2)': 'float32'},
+        )
+    except ValueError as e:
+        print(f"错误：无法解析文件 '{csv_file}': {e}")
+        return None
+
+    # 将数据按索引直接写入二维网格，不经过 pivot
+    # 行对应Y轴(Z_Index), 列对应X轴(Theta_Index)，缺失的网格点先置为NaN
+    z = df['Z_Index'].to_numpy(np.int32)
+    theta = df['Theta_Index'].to_numpy(np.int32)
+    flux = df['Flux_Density(W/m^2)'].to_numpy(np.float32)
+    # 直接按索引写入时，负索引会绕回另一侧、重复的 (Z, Theta) 只保留最后一个值，因此先检查
+    if z.size == 0 or z.min() < 0 or theta.min() < 0 or \
+            np.bincount(z.astype(np.int64) * (theta.max() + 1) + theta).max() > 1:
+        print(f"错误：无法将 '{csv_file}' 的数据转换为网格。数据是否为完整的网格（索引非负且不重复）？")
+        return None
+    flux_grid = np.full((z.max() + 1, theta.max() + 1), np.nan, np.float32)
+    flux_grid[z, theta] = flux
+
+    # 先写入同一目录下的临时文件再替换，写入中途被中断也不会留下不完整的缓存
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(cache_path) + '.', suffix='.tmp',
+                                        dir=os.path.dirname(os.path.abspath(cache_path)))
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, flux_grid)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"警告：无法写入缓存文件 '{cache_path}': {e}")
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    flux_grid.flags.writeable = False  # 结果会被多次调用共享，禁止原地修改
+    return flux_grid
+
+
+def plot_receiver_flux_map(flux_grid, receiver_base_z, receiver_height, show=False):
+    """
+    根据CUDA仿真生成的接收器能流密度网格绘制热力图。
 
     Args:
-        csv_file (str): 包含能流密度数据的CSV文件名。
+        flux_grid (np.ndarray): 能流密度网格（由 load_flux_matrix 加载，行对应高度，列对应角度）。
         receiver_base_z (float): 接收器底部的高度 (m)。
         receiver_height (float): 接收器的高度 (m)。
+        show (bool): 保存后是否在屏幕上显示图像；默认直接关闭画布（批处理模式）。
     """
     # --- 1. 设置绘图环境 (支持中文) ---
     # 指定一个支持中文的字体，例如 'SimHei' (黑体) 或 'Microsoft YaHei' (微软雅黑)
@@ -23,41 +110,51 @@ def plot_receiver_flux_map(csv_file, receiver_base_z, receiver_height):
     plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
     plt.style.use('default')  # 使用默认样式
 
-    # --- 2. 加载和处理数据 ---
-    print(f"正在读取数据文件: {csv_file}...")
-    try:
-        df = pd.read_csv(csv_file)
-    except FileNotFoundError:
-        print(f"错误：找不到文件 '{csv_file}'。请确保CUDA程序已成功运行并生成该文件。")
-        return
-
-    # 将数据透视为二维网格
-    # index对应Y轴, columns对应X轴
-    flux_data = df.pivot(index='Z_Index', columns='Theta_Index', values='Flux_Density(W/m^2)')
+    # --- 2. 处理数据 ---
+    # 颜色范围：缺失的网格点按 0 计入，与先将 NaN 置 0 再取最值一致
+    flux_min, flux_max = np.nanmin(flux_grid), np.nanmax(flux_grid)
+    if np.isnan(flux_grid).any():
+        flux_min, flux_max = min(flux_min, 0.0), max(flux_max, 0.0)
 
-    # 转换为Numpy数组，并处理可能存在的NaN值
-    flux_grid = flux_data.to_numpy()
-    flux_grid = np.nan_to_num(flux_grid, nan=0.0)
+    # 处理可能存在的NaN值，并归一化到 [0, 1]（nan_to_num 生成副本，其余步骤原地完成）
+    flux_norm = np.nan_to_num(flux_grid, nan=0.0)
+    np.clip(flux_norm, flux_min, flux_max, out=flux_norm)
+    flux_norm -= flux_min
+    if flux_max > flux_min:
+        flux_norm /= flux_max - flux_min
 
     # 获取网格维度
     grid_h, grid_w = flux_grid.shape
     print(f"数据加载成功，网格维度: {grid_w}(角度) x {grid_h}(高度)")
 
     # --- 3. 绘图 ---
-    fig, ax = plt.subplots(figsize=(12, 8), facecolor='#d6e8ff')  # 设置画布尺寸和背景色
+    # 设置画布尺寸和背景色；constrained_layout 在绘制时排版，省去 tight_layout 的额外测量
+    fig, ax = plt.subplots(figsize=(12, 8), facecolor='#d6e8ff', constrained_layout=True)
     ax.set_facecolor('#d6e8ff')  # 设置绘图区背景色
 
-    # 使用imshow绘制热力图
-    # extent参数定义了图像的坐标范围: [x_min, x_max, y_min, y_max]
+    # 网格是均匀的，使用pcolorfast绘制热力图（走最简单的图像路径）
+    # 前两个参数定义了图像的坐标范围: [x_min, x_max], [y_min, y_max]
     # x轴: 方位角从 -180 (南) -> -90 (西) -> 0 (北) -> 90 (东) -> 180 (南)
     # y轴: 接收器物理高度
-    # origin='lower' 表示 (0,0) 索引在左下角，这与我们的Z_Index=0在底部相匹配
-    im = ax.imshow(
-        flux_grid,
-        cmap='jet',  # 使用'jet'色彩映射，与示例图类似
-        extent=[-180, 180, receiver_base_z, receiver_base_z + receiver_height],
-        interpolation='bicubic',  # 使用双三次插值使图像更平滑
-        aspect='auto'
+    # 图像方向: 网格第 0 行 (Z_Index=0) 画在顶部，与原先 imshow 的输出一致（见下方的行翻转）
+    # 按 300 dpi 下的输出像素尺寸做一次三次插值重采样（放大或缩小）使图像更平滑，
+    # 绘图时只需最近邻贴图，不必在每次绘制/保存时做双三次插值
+    # 重采样后裁剪回 [0, 1]，避免三次插值过冲改变颜色条范围
+    target_w, target_h = int(fig.get_figwidth() * 300), int(fig.get_figheight() * 300)
+    zoom_factors = (target_h / grid_h, target_w / grid_w)
+    flux_norm = ndimage.zoom(flux_norm, zoom_factors, order=3, mode='nearest')
+    np.clip(flux_norm, 0.0, 1.0, out=flux_norm)
+    # 一次性映射为 uint8 RGBA 图像（数据已归一化，直接查色谱），绘制时不再逐次执行 Normalize + 色谱转换
+    norm = mpl.colors.Normalize(vmin=flux_min, vmax=flux_max)
+    cmap = mpl.colormaps['jet']  # 使用'jet'色彩映射，与示例图类似
+    # 注意原先的 imshow 使用默认的 origin='upper'（第 0 行在顶部），而 pcolorfast 从底部开始画，
+    # 这里翻转行顺序以保持输出图像方向不变；在映射前翻转，交给 matplotlib 的 RGBA 是 C 连续的，
+    # 避免其内部为负步长的视图再复制一次
+    rgba = cmap(flux_norm[::-1], bytes=True)
+    ax.pcolorfast(
+        [-180, 180],
+        [receiver_base_z, receiver_base_z + receiver_height],
+        rgba,
     )
 
     # --- 4. 设置坐标轴、标题和颜色条 ---
@@ -65,31 +162,46 @@ def plot_receiver_flux_map(csv_file, receiver_base_z, receiver_height):
     ax.set_xlabel("方位角（度）- 正南为-180°/180°，正北为 0°", fontsize=12)
     ax.set_ylabel("接收器高度（m）", fontsize=12)
 
-    # 设置Y轴刻度
-    ax.set_yticks(np.arange(int(receiver_base_z), int(receiver_base_z + receiver_height) + 1, 1.0))
+    # 设置Y轴刻度（刻度很少，直接用列表，无需 ndarray）
+    ax.set_yticks(list(range(int(receiver_base_z), int(receiver_base_z + receiver_height) + 1)))
     # 设置X轴刻度
-    ax.set_xticks(np.arange(-180, 181, 30))
+    ax.set_xticks(list(range(-180, 181, 30)))
 
     # 添加颜色条
-    cbar = fig.colorbar(im, ax=ax, pad=0.02)
+    sm = mpl.cm.ScalarMappable(norm, cmap)
+    sm.set_array([])
+    cbar = fig.colorbar(sm, ax=ax, pad=0.02)
     cbar.set_label("能量密度 (W/m²)", fontsize=12)
 
     # 添加网格线
     ax.grid(True, linestyle='--', color='white', alpha=0.5)
 
     # --- 5. 显示和保存图像 ---
-    plt.tight_layout()
     output_filename = "receiver_flux_map.png"
-    plt.savefig(output_filename, dpi=300, facecolor=fig.get_facecolor())
+    # 使用 1 级 PNG 压缩，编码比默认的 6 级快得多，文件只略大一些
+    plt.savefig(output_filename, dpi=300, facecolor=fig.get_facecolor(), pil_kwargs={'compress_level': 1})
     print(f"绘图完成，已保存为 '{output_filename}'")
-    plt.show()
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="绘制接收器能流密度分布图。")
+    parser.add_argument('--show', action='store_true', help="保存后在屏幕上显示图像")
+    args = parser.parse_args()
+    # 批处理模式（默认）使用无界面的 Agg 后端，跳过 GUI 后端及其事件循环的初始化
+    # pyplot 在创建第一个图形时才真正加载后端，因此这里设置仍然有效
+    if not args.show:
+        mpl.use('Agg')
+
     # --- 配置参数 (必须与 main.cu 中的 SimConfig 保持一致!) ---
     # 从您的main.cu文件中获取这些值
     RECEIVER_BASE_Z = 76.0
     RECEIVER_HEIGHT = 8.0
     CSV_FILENAME = "receiver_flux_map.csv"
 
-    plot_receiver_flux_map(CSV_FILENAME, RECEIVER_BASE_Z, RECEIVER_HEIGHT)
\ No newline at end of file
+    FLUX_GRID = load_flux_matrix(CSV_FILENAME)
+    if FLUX_GRID is not None:
+        plot_receiver_flux_map(FLUX_GRID, RECEIVER_BASE_Z, RECEIVER_HEIGHT, show=args.show)
\ No newline at end of file
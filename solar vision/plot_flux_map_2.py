@@ -1,7 +1,21 @@
+import argparse
 import numpy as np
-import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pac
+import matplotlib as mpl
+
+# --- 0. 命令行参数 ---
+# 批处理模式（默认）在导入 pyplot 之前切换到无界面的 Agg 后端，跳过 GUI 后端及其事件循环的初始化，
+# 并将图像保存为文件；传入 --show 时才在屏幕上显示
+parser = argparse.ArgumentParser(description='平滑并绘制接收器能流密度分布图。')
+parser.add_argument('--show', action='store_true', help='在屏幕上显示图像，而不是保存为文件')
+args = parser.parse_args()
+if not args.show:
+    mpl.use('Agg')
+
 import matplotlib.pyplot as plt
-from scipy.ndimage import gaussian_filter
+from scipy.ndimage import gaussian_filter1d, zoom
+from scipy.signal import fftconvolve
 
 # --- 1. 可配置参数 ---
 CSV_FILE_PATH = 'receiver_flux_map.csv'
@@ -14,16 +28,47 @@ GRID_HEIGHT = 512 # C++中设置的高度方向分辨率
 
 # 可视化参数
 FIG_TITLE = '接收器能量密度分布光斑图 (3月21日 12:00 - 全场)'
+OUTPUT_FILENAME = 'receiver_flux_map_smoothed.png' # 批处理模式下保存的文件名
 COLOR_MAP = 'jet'
 SMOOTHING_SIGMA = 1.2 # 推荐值 1.0-2.0
 VMIN = 0
 VMAX = 400
+FFT_SIGMA_THRESHOLD = 4.0 # sigma 不小于该值时改用 FFT 卷积
+
+
+def smooth_flux(data, sigma):
+    """
+    对能流密度网格做高斯平滑，边界按最近值延拓。
+
+    小 sigma 时沿两个轴各做一次一维高斯滤波（可分离卷积）；
+    大 sigma 时卷积核很宽，改用 FFT 卷积更快。
+    """
+    if sigma < FFT_SIGMA_THRESHOLD:
+        smoothed = gaussian_filter1d(data, sigma, axis=0, mode='nearest')
+        return gaussian_filter1d(smoothed, sigma, axis=1, mode='nearest')
+
+    # 与 scipy 默认一致，卷积核截断在 4 个 sigma 处
+    p = int(4.0 * sigma + 0.5)
+    g1d = np.exp(-0.5 * (np.arange(-p, p + 1) / sigma) ** 2)
+    g1d /= g1d.sum()
+    gkernel2d = np.outer(g1d, g1d)
+    # 先按最近值填充边界，再取 valid 部分，结果尺寸与输入相同
+    padded = np.pad(data, p, mode='edge')
+    return fftconvolve(padded, gkernel2d, mode='valid').astype(data.dtype, copy=False)
+
 
 # --- 2. 加载和重塑数据 ---
 try:
     print(f"正在加载数据: {CSV_FILE_PATH}...")
-    df = pd.read_csv(CSV_FILE_PATH)
-    flux_data = df['Flux_Density(W/m^2)'].values.reshape((GRID_HEIGHT, GRID_WIDTH))
+    # 只解析能流密度一列，直接转为 Numpy 数组，不构建完整的 DataFrame
+    tbl = pac.read_csv(
+        CSV_FILE_PATH,
+        convert_options=pac.ConvertOptions(
+            include_columns=['Flux_Density(W/m^2)'],
+            column_types={'Flux_Density(W/m^2)': pa.float32()},
+        ),
+    )
+    flux_data = tbl.column(0).to_numpy(zero_copy_only=False).reshape((GRID_HEIGHT, GRID_WIDTH))
     print("数据加载并重塑成功。")
 except Exception as e:
     print(f"错误: 无法加载或重塑数据。请检查文件路径和网格尺寸配置。")
@@ -31,29 +76,39 @@ except Exception as e:
     exit()
 
 # --- 3. 数据处理 ---
-# 应用高斯平滑
-#if SMOOTHING_SIGMA > 0:
+# 应用高斯平滑；SMOOTHING_SIGMA = 0 时直接使用原始数据，跳过卷积
+if SMOOTHING_SIGMA > 0:
     print(f"应用高斯平滑 (sigma={SMOOTHING_SIGMA})...")
-    flux_data_processed = gaussian_filter(flux_data, sigma=SMOOTHING_SIGMA)
-#else:
-flux_data_processed = flux_data
+    flux_data_processed = smooth_flux(flux_data, SMOOTHING_SIGMA)
+else:
+    flux_data_processed = flux_data
 
 # --- 4. 绘图 ---
 
 print("开始绘图...")
-fig, ax = plt.subplots(figsize=(16, 9))
-
-# 使用imshow绘制热力图
-# extent 定义了图像四个角的物理坐标 [left, right, bottom, top]
-im = ax.imshow(
-    flux_data_processed,
-    aspect='auto',
-    cmap=COLOR_MAP,
-    extent=[-180, 180, RECEIVER_BASE_Z_M, RECEIVER_BASE_Z_M + RECEIVER_HEIGHT_M],
-    origin='lower',
-    interpolation='bicubic',
-    vmin=VMIN,
-    vmax=VMAX
+fig, ax = plt.subplots(figsize=(16, 9), constrained_layout=True)  # 绘制时自动排版，无需 tight_layout
+
+# 网格是均匀的，使用pcolorfast绘制热力图（走最简单的图像路径，第 0 行画在底部）
+# 前两个参数定义了图像四个角的物理坐标 [left, right], [bottom, top]
+# 按屏幕输出像素尺寸做一次三次插值重采样（放大或缩小），
+# 绘图时只需最近邻贴图，不必在每次重绘时做双三次插值
+target_w, target_h = int(fig.get_figwidth() * fig.dpi), int(fig.get_figheight() * fig.dpi)
+zoom_factors = (target_h / GRID_HEIGHT, target_w / GRID_WIDTH)
+flux_data_processed = zoom(flux_data_processed, zoom_factors, order=3, mode='nearest')
+# 处理可能存在的NaN值，并归一化到 [0, 1]（nan_to_num 生成副本，其余步骤原地完成）
+flux_norm = np.nan_to_num(flux_data_processed, nan=0.0)
+np.clip(flux_norm, VMIN, VMAX, out=flux_norm)
+flux_norm -= VMIN
+if VMAX > VMIN:
+    flux_norm /= VMAX - VMIN
+# 一次性映射为 uint8 RGBA 图像（数据已归一化，直接查色谱），重绘时不再逐次执行 Normalize + 色谱转换
+norm = mpl.colors.Normalize(vmin=VMIN, vmax=VMAX)
+cmap = mpl.colormaps[COLOR_MAP]
+rgba = cmap(flux_norm, bytes=True)
+ax.pcolorfast(
+    [-180, 180],
+    [RECEIVER_BASE_Z_M, RECEIVER_BASE_Z_M + RECEIVER_HEIGHT_M],
+    rgba
 )
 
 # 设置坐标轴和标题
@@ -62,17 +117,23 @@ ax.set_xlabel('方位角 (度) - 正北为0° / 正南为±180°', fontsize=14,
 ax.set_ylabel('接收器高度 (m)', fontsize=14, fontproperties="SimHei")
 
 # 设置坐标轴刻度
-ax.set_xticks(np.arange(-180, 181, 30))
+ax.set_xticks(list(range(-180, 181, 30)))
 ax.grid(True, linestyle='--', linewidth=0.5, color='white', alpha=0.7)
 
 # 添加颜色条
-cbar = fig.colorbar(im, ax=ax)
+sm = mpl.cm.ScalarMappable(norm, cmap)
+sm.set_array([])
+cbar = fig.colorbar(sm, ax=ax)
 cbar.set_label('能量密度 (W/m2)', fontsize=14, fontproperties="SimHei")
 
 # 设置整体外观
 fig.patch.set_facecolor('#E6F0FF')
 ax.set_facecolor('#E6F0FF')
 
-plt.tight_layout()
-print("绘图完成，正在显示图像...")
-plt.show()
\ No newline at end of file
+if args.show:
+    print("绘图完成，正在显示图像...")
+    plt.show()
+else:
+    # 使用 1 级 PNG 压缩，编码比默认的 6 级快得多，文件只略大一些
+    plt.savefig(OUTPUT_FILENAME, facecolor=fig.get_facecolor(), pil_kwargs={'compress_level': 1})
+    print(f"绘图完成，已保存为 '{OUTPUT_FILENAME}'")
\ No newline at end of file